@@ -15,11 +15,8 @@ setuptools.setup(
     license_files=("LICENSE"),
     classifiers=[
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
-        "Programming Language :: Python :: 3.8",
-        "Programming Language :: Python :: 3.9",
-        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
         "License :: OSI Approved :: Apache Software License",
         "Operating System :: Unix",
         "Operating System :: MacOS",
@@ -27,8 +24,9 @@ setuptools.setup(
     ],
     package_dir={"": "src"},
     packages=setuptools.find_packages(where="src"),
-    python_requires=">=3.6",
-    install_requires=["pygobject", "dbus-python", "tomlkit", "astral", "tzlocal"],
+    python_requires=">=3.11",
+    install_requires=["pygobject", "dbus-python", "tomlkit", "tzlocal"],
+    extras_require={"test": ["pytest"]},
     entry_points={
         "console_scripts": [
             "alacritty-circadian = alacritty_circadian.alacritty_circadian:main",
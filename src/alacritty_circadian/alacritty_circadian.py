@@ -6,28 +6,38 @@ via explicit time or phases of the sun
 """
 
 # Std imports
+import logging
 import os
+import shutil
 import sys
+import tomllib
 from argparse import ArgumentParser
+from bisect import bisect_right
+from dataclasses import dataclass
 from pathlib import Path
-from pprint import pprint
-from datetime import datetime, timezone, timedelta
-from threading import Thread, Timer, Lock, get_ident
-
-# dbus
-import dbus
-from dbus.mainloop.glib import DBusGMainLoop
-from gi.repository import GLib
-
-# External imports
-from tomlkit import load as load_toml, dump as dump_toml
-from astral import Observer
-from astral.sun import sun
-
-# Create global thread lock
-lock = Lock()
-# Global thread queue
-thread_list = []
+from datetime import datetime, time, timezone, timedelta
+from functools import lru_cache
+from math import acos, asin, ceil, cos, degrees, radians, sin, tan
+from typing import NamedTuple
+
+# External imports, dbus and gi are imported where used as they're heavy
+# and not needed until the main loop is set up
+from tomlkit import TOMLDocument, load as load_toml, dumps as dumps_toml
+
+logger = logging.getLogger(__name__)
+# Local timezone at the last schedule_theme_switch, switch tables are
+# recomputed when it changes
+LOCAL_TZ = datetime.now().astimezone().tzinfo
+# GLib source id of the pending theme switch timeout
+switch_source_id = None
+# Colors last written to alacritty_dest
+written_colors = None
+# Parsed theme files, keyed by path, invalidated by theme_folder_monitor
+_theme_cache: dict = {}
+# Kept around, the monitor stops once garbage collected
+theme_folder_monitor = None
+# Set by main
+app = None
 
 
 def check_path(p: Path) -> Path:
@@ -37,55 +47,6 @@ def check_path(p: Path) -> Path:
     return p
 
 
-config_path_str = (
-    os.getenv("APPDATA") if sys.platform == "win32" else os.getenv("XDG_CONFIG_HOME")
-)
-config_path_str = "~/.config" if not config_path_str else config_path_str
-alacritty_path = (Path(config_path_str) / "alacritty").expanduser()
-parser = ArgumentParser(
-    prog="alacritty_circadian", description="Change your alacritty theme by time of day"
-)
-parser.add_argument(
-    "-s",
-    "--alacritty-source",
-    type=Path,
-    default=alacritty_path / "alacritty.toml",
-    help="Location of your `alacritty.toml` file. NOTE: This will be read from.",
-)
-parser.add_argument(
-    "-d",
-    "--alacritty-dest",
-    type=Path,
-    default=alacritty_path / "alacritty.toml",
-    help="Location of your `alacritty.toml` file. NOTE: This will be read from.",
-)
-parser.add_argument(
-    "-c",
-    "--circadian-path",
-    type=Path,
-    default=alacritty_path / "circadian.toml",
-    help="Location of your `circadian.toml` file",
-)
-args = parser.parse_args()
-alacritty_source = check_path(args.alacritty_source)
-circadian_path = check_path(args.circadian_path)
-alacritty_dest = args.alacritty_dest.expanduser()
-
-if alacritty_source == alacritty_dest:
-    print(
-        "[WARN] Your alacritty source and destination files are the same. This file will be mutated twice daily."
-    )
-    print("[WARN] You may wish to keep a source alacritty.toml in source control.")
-
-with open(alacritty_source) as f:
-    config = load_toml(f)
-
-with open(circadian_path, "r") as f:
-    circadian = load_toml(f)
-theme_folder_path = Path(str(circadian["theme-folder"])).expanduser()
-check_path(theme_folder_path)
-
-
 times_of_sun = {
     "dawn",
     "sunrise",
@@ -95,167 +56,501 @@ times_of_sun = {
 }
 
 
-def switch_theme(theme_data):
+def get_coordinates(circadian):
     """
-    Put theme_data in alacritty's config_data.
+    Parse the latitude and longitude of the circadian config.
     """
-    config["colors"] = theme_data["colors"]
-    with open(alacritty_dest, "w") as f:
-        if not f.writable():
-            print(f"{f} not writable")
-        dump_toml(config, f)
+    s_lat = circadian.get("coordinates", {}).get("latitude")
+    s_lon = circadian.get("coordinates", {}).get("longitude")
+    try:
+        return float(s_lat), float(s_lon)
+    except (TypeError, ValueError):
+        sys.exit(f"[ERROR] Coordinates {s_lat}, {s_lon} not valid number(s)")
+
+
+class Observer(NamedTuple):
+    latitude: float
+    longitude: float
 
 
-def thread_switch_theme(theme_data):
+def _solar_position(jd):
     """
-    Wrapper function to make a thread run switch_theme and exit gracefully.
-    See switch_theme for more info.
+    Declination (in radians) and equation of time (in minutes) of the sun at
+    the julian day jd, from the NOAA solar calculator.
     """
-    # Thread locking to prevent race conditions
-    with lock:
-        switch_theme(theme_data)
-    print("[LOG] Thread timer- {get_ident()} has finished execution, exiting")
-    sys.exit()
+    t = (jd - 2451545.0) / 36525.0
+    mean_long = radians((280.46646 + t * (36000.76983 + t * 0.0003032)) % 360)
+    mean_anom = radians(357.52911 + t * (35999.05029 - t * 0.0001537))
+    eccent = 0.016708634 - t * (0.000042037 + t * 0.0000001267)
+    center = (
+        sin(mean_anom) * (1.914602 - t * (0.004817 + t * 0.000014))
+        + sin(2 * mean_anom) * (0.019993 - t * 0.000101)
+        + sin(3 * mean_anom) * 0.000289
+    )
+    omega = radians(125.04 - 1934.136 * t)
+    app_long = radians(degrees(mean_long) + center - 0.00569 - 0.00478 * sin(omega))
+    obliq_secs = 21.448 - t * (46.815 + t * (0.00059 - t * 0.001813))
+    mean_obliq = 23 + (26 + obliq_secs / 60) / 60
+    obliq = radians(mean_obliq + 0.00256 * cos(omega))
+    decl = asin(sin(obliq) * sin(app_long))
+    y = tan(obliq / 2) ** 2
+    eq_time = 4 * degrees(
+        y * sin(2 * mean_long)
+        - 2 * eccent * sin(mean_anom)
+        + 4 * eccent * y * sin(mean_anom) * cos(2 * mean_long)
+        - 0.5 * y * y * sin(4 * mean_long)
+        - 1.25 * eccent * eccent * sin(2 * mean_anom)
+    )
+    return decl, eq_time
 
 
-def get_theme_time(theme, now_time):
+def _sun_event(observer, day, zenith, direction):
+    """
+    Time of the sun crossing zenith (in degrees) on day, before noon if
+    direction is -1, after noon if direction is 1, or noon if direction is 0.
+    None if the sun doesn't cross zenith that day.
     """
-    Get the time associated with theme, either from a times_of_sun
-    String or an HH:MM timestamp.
+    lat = radians(observer.latitude)
+    midnight = datetime.combine(day, time(), tzinfo=timezone.utc)
+    # Julian day of midnight UTC
+    jd = day.toordinal() + 1721424.5
+    minutes = 720 - 4 * observer.longitude
+    # The sun moves little in a day, a couple of refinements are plenty
+    for _ in range(3):
+        decl, eq_time = _solar_position(jd + minutes / 1440)
+        minutes = 720 - 4 * observer.longitude - eq_time
+        if direction:
+            cos_ha = cos(radians(zenith)) / (cos(lat) * cos(decl))
+            cos_ha -= tan(lat) * tan(decl)
+            # Polar days and nights never cross zenith
+            if abs(cos_ha) > 1:
+                return None
+            hour_angle = degrees(acos(cos_ha))
+            minutes += direction * 4 * hour_angle
+    return midnight + timedelta(minutes=minutes)
+
+
+def sun(observer, day):
     """
+    Times of the sun at observer on the UTC date day, in UTC. Dawn and dusk
+    are civil twilight, sunrise and sunset account for atmospheric refraction.
+    Phases the sun doesn't reach that day, during polar days and nights, are
+    None.
+    """
+    return {
+        "dawn": _sun_event(observer, day, 96, -1),
+        "sunrise": _sun_event(observer, day, 90.833, -1),
+        "noon": _sun_event(observer, day, 90, 0),
+        "sunset": _sun_event(observer, day, 90.833, 1),
+        "dusk": _sun_event(observer, day, 96, 1),
+    }
+
+
+@lru_cache(maxsize=8)
+def _sun_cached(observer, day):
+    """
+    Times of the sun at observer on the UTC (solar) date day, not the local
+    date, see get_theme_times. These only change once per day, so cache them.
+    """
+    return sun(observer, day)
+
+
+@dataclass(slots=True)
+class CompiledTheme:
+    """
+    A theme of the circadian config, resolved once at startup.
+    """
+
+    name: str
+    path: Path
+    # Either the sun phase of the switch, or its HH:MM localtime
+    solar_phase: str | None = None
+    hour: int = 0
+    minute: int = 0
+
+    @property
+    def theme_data(self):
+        return load_theme(self.path)
+
+
+def load_theme(path: Path):
+    """
+    Load the theme file at path, reusing the parsed result from a previous
+    call unless the file has been modified since. Note that the theme folder
+    monitor only sees changes to the folder's own entries: editing the target
+    of a symlinked theme (e.g. into an alacritty-theme checkout) doesn't
+    reload it.
+    """
+    theme_data = _theme_cache.get(path)
+    if theme_data is None:
+        with open(path, "rb") as f:
+            theme_data = tomllib.load(f)
+        _theme_cache[path] = theme_data
+    return theme_data
+
+
+def handle_theme_folder_change(monitor, file, other_file, event_type):
+    from gi.repository import Gio
+
+    if event_type in (
+        Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+        Gio.FileMonitorEvent.CREATED,
+    ):
+        _theme_cache.pop(Path(file.get_path()), None)
+
+
+def watch_theme_folder():
+    """
+    Monitor the theme folder for theme files being modified.
+    """
+    from gi.repository import Gio
+
+    global theme_folder_monitor
+    folder = Gio.File.new_for_path(str(app.theme_folder_path))
+    theme_folder_monitor = folder.monitor_directory(Gio.FileMonitorFlags.NONE, None)
+    theme_folder_monitor.connect("changed", handle_theme_folder_change)
+
+
+def switch_theme(theme):
+    """
+    Put the theme data in alacritty's config_data and write it to
+    alacritty_dest, unless those colors are already there.
+    """
+    global written_colors
+    theme_data = theme.theme_data
+    if theme_data["colors"] == written_colors:
+        return
+    # Write through symlinks (e.g. from dotfile managers) rather than over them
+    dest = Path(os.path.realpath(app.alacritty_dest))
+    tmp_path = dest.with_name(dest.name + ".tmp")
+    if app.copy_themes:
+        # There's nothing else to keep from the config, use the theme as is
+        shutil.copyfile(theme.path, tmp_path)
+    else:
+        config = app.alacritty_source_cfg
+        config["colors"] = theme_data["colors"]
+        tmp_path.write_text(dumps_toml(config))
+    if dest.exists():
+        shutil.copymode(dest, tmp_path)
+    # Renaming is atomic, so alacritty never reads a partially written file
+    os.replace(tmp_path, dest)
+    written_colors = theme_data["colors"]
+
+
+def compile_theme(theme, theme_folder_path):
+    """
+    Check that the theme is installed and parse its time, either a
+    times_of_sun String or an HH:MM timestamp.
+    """
+    theme_path = theme_folder_path / f"{theme['name']}.toml"
+    if not theme_path.exists():
+        sys.exit(f"[ERROR] Theme {theme['name']} not installed in {theme_folder_path}")
+    # Parse it once now, so that a broken theme fails at startup
+    load_theme(theme_path)
     theme_time_str = theme["time"]
     if theme_time_str in times_of_sun:
-        s_lat = circadian.get("coordinates", {}).get("latitude")
-        s_lon = circadian.get("coordinates", {}).get("longitude")
-        ok = True
-        d = {"lat": s_lat, "lon": s_lon}
-        # Catch both errors at once, if exist
-        for k, v in d.items():
-            try:
-                d[k] = float(v)
-            except ValueError:
-                ok = False
-        if not ok:
-            sys.exit(f"[ERROR] Coordinates {s_lat}, {s_lon} not valid number(s)")
-        obs = Observer(latitude=d["lat"], longitude=d["lon"])
-        theme_time = sun(obs)[theme_time_str]
-    else:
-        try:
-            theme_time = datetime.strptime(theme["time"], "%H:%M")
-        except ValueError:
-            sys.exit(f"[ERROR] Unknown time format {theme['time']}")
-    theme_time = theme_time.replace(
-        year=now_time.year, month=now_time.month, day=now_time.day
+        return CompiledTheme(
+            name=theme["name"], path=theme_path, solar_phase=theme_time_str
+        )
+    try:
+        theme_time = datetime.strptime(theme_time_str, "%H:%M")
+    except ValueError:
+        sys.exit(f"[ERROR] Unknown time format {theme_time_str}")
+    return CompiledTheme(
+        name=theme["name"],
+        path=theme_path,
+        hour=theme_time.hour,
+        minute=theme_time.minute,
     )
-    # "Convert" to localtime (datetime doesn't convert since the time is the
-    # same as the localtime, so actually we just make the naive timestamp
-    # offset aware)
-    theme_time = theme_time.astimezone(tz=None)
-    # Convert to UTC
-    theme_time = theme_time.astimezone(tz=timezone.utc)
-    return theme_time
 
 
-def set_appropriate_theme(now_time):
+def get_theme_times(theme, day):
     """
-    Get the nearest neighbor themes list element to now_time and set it as the
-    current theme.
+    Get the switch times of theme on the local date day. A sun phase can
+    happen zero, one or (around midnight) two times on the same date.
     """
-    # nearest list element neighbor to now_time
-    diff = -1
-    try:
-        themes = circadian["themes"]
-    except KeyError:
+    if theme.solar_phase is None:
+        return [datetime.combine(day, time(theme.hour, theme.minute)).astimezone()]
+    # Sun phases follow the solar day, which away from the timezone's meridian
+    # (or around midnight) can end up on the previous/next date
+    theme_times = []
+    for solar_day in (day - timedelta(days=1), day, day + timedelta(days=1)):
+        theme_time = _sun_cached(app.observer, solar_day)[theme.solar_phase]
+        if theme_time is not None and theme_time.astimezone().date() == day:
+            theme_times.append(theme_time)
+    return theme_times
+
+
+@dataclass(slots=True, frozen=True)
+class AppConfig:
+    """
+    The configuration of the daemon, loaded once at startup.
+    """
+
+    alacritty_source_cfg: TOMLDocument
+    alacritty_dest: Path
+    circadian_cfg: dict
+    theme_folder_path: Path
+    themes: list[CompiledTheme]
+    # Only set if a sun phase is used
+    observer: Observer | None
+    # Whether the alacritty config has nothing but colors, in which case theme
+    # files can be copied over alacritty_dest
+    copy_themes: bool
+
+
+def _bootstrap():
+    """
+    Parse the command line and load the alacritty and circadian configs.
+    """
+    config_path_str = (
+        os.getenv("APPDATA")
+        if sys.platform == "win32"
+        else os.getenv("XDG_CONFIG_HOME")
+    )
+    config_path_str = "~/.config" if not config_path_str else config_path_str
+    alacritty_path = (Path(config_path_str) / "alacritty").expanduser()
+    parser = ArgumentParser(
+        prog="alacritty_circadian",
+        description="Change your alacritty theme by time of day",
+    )
+    parser.add_argument(
+        "-s",
+        "--alacritty-source",
+        type=Path,
+        default=alacritty_path / "alacritty.toml",
+        help="Location of your `alacritty.toml` file. NOTE: This will be read from.",
+    )
+    parser.add_argument(
+        "-d",
+        "--alacritty-dest",
+        type=Path,
+        default=alacritty_path / "alacritty.toml",
+        help="Location of your `alacritty.toml` file. NOTE: This will be read from.",
+    )
+    parser.add_argument(
+        "-c",
+        "--circadian-path",
+        type=Path,
+        default=alacritty_path / "circadian.toml",
+        help="Location of your `circadian.toml` file",
+    )
+    args = parser.parse_args()
+    alacritty_source = check_path(args.alacritty_source)
+    circadian_path = check_path(args.circadian_path)
+    alacritty_dest = args.alacritty_dest.expanduser()
+
+    if alacritty_source == alacritty_dest:
+        logger.warning(
+            "Your alacritty source and destination files are the same. This file will be mutated twice daily."
+        )
+        logger.warning(
+            "You may wish to keep a source alacritty.toml in source control."
+        )
+
+    with open(alacritty_source) as f:
+        config = load_toml(f)
+
+    with open(circadian_path, "rb") as f:
+        circadian = tomllib.load(f)
+    # Absolute and normalized, like the paths reported by theme_folder_monitor
+    theme_folder_path = check_path(Path(str(circadian["theme-folder"]))).resolve()
+
+    # Coordinates are only needed (and validated) if a sun phase is used
+    observer = None
+    if any(theme.get("time") in times_of_sun for theme in circadian.get("themes", [])):
+        latitude, longitude = get_coordinates(circadian)
+        observer = Observer(latitude=latitude, longitude=longitude)
+
+    if "themes" not in circadian:
         sys.exit("[ERROR] Circadian config theme section not found")
+    themes = [compile_theme(theme, theme_folder_path) for theme in circadian["themes"]]
     if not themes:
         sys.exit("[ERROR] No themes specified in circadian config")
-    for theme in themes:
-        theme_time = get_theme_time(theme, now_time)
-        switch_time = now_time.replace(
-            hour=theme_time.hour, minute=theme_time.minute, second=0, microsecond=0
+
+    return AppConfig(
+        alacritty_source_cfg=config,
+        alacritty_dest=alacritty_dest,
+        circadian_cfg=circadian,
+        theme_folder_path=theme_folder_path,
+        themes=themes,
+        observer=observer,
+        copy_themes=set(config) <= {"colors"},
+    )
+
+
+# Longest stretch of days to look for a switch in, before giving up
+MAX_SEARCH_DAYS = 366
+
+
+# Big enough to hold the days looked through both ways during a polar night
+@lru_cache(maxsize=2 * MAX_SEARCH_DAYS)
+def compute_switch_table(day):
+    """
+    Get the switch times of all the themes on the local date day, truncated to
+    the minute, as (switch_times, themes, skipped) where the first two are
+    parallel lists sorted by switch time. Themes whose sun phase doesn't happen
+    that day are left out and listed in skipped, and of the themes sharing a
+    switch time only the last one of the config is kept.
+    """
+    switches = []
+    skipped = []
+    for theme in app.themes:
+        theme_times = get_theme_times(theme, day)
+        if not theme_times:
+            skipped.append(f"{theme.name} ({theme.solar_phase})")
+        for theme_time in theme_times:
+            switches.append((theme_time.replace(second=0, microsecond=0), theme))
+    # The sort is stable, so the dict keeps the last theme of each switch time,
+    # the one applied both on timeouts and when setting the current theme
+    switches.sort(key=lambda s: s[0])
+    switches = dict(switches)
+    return list(switches), list(switches.values()), skipped
+
+
+def set_appropriate_theme(now_time):
+    """
+    Get the theme which most recently switched before now_time, a localtime,
+    and set it as the current theme.
+    """
+    day = now_time.date()
+    for _ in range(MAX_SEARCH_DAYS):
+        switch_times, themes, _skipped = compute_switch_table(day)
+        idx = bisect_right(switch_times, now_time)
+        if idx > 0:
+            switch_theme(themes[idx - 1])
+            return
+        # None of the day's switches happened yet, look at the previous day
+        day -= timedelta(days=1)
+    sys.exit("[ERROR] None of the themes switched within the last year")
+
+
+def next_switch_deadline(now_time):
+    """
+    Get the earliest theme switch strictly after now_time, a localtime, as a
+    (switch_time, theme, skipped) tuple, skipped listing the themes whose sun
+    phase doesn't happen on any of the days until then.
+    """
+    day = now_time.date()
+    # Themes skipped on any of the days looked through, without duplicates
+    skipped = {}
+    for _ in range(MAX_SEARCH_DAYS):
+        switch_times, themes, day_skipped = compute_switch_table(day)
+        skipped.update(dict.fromkeys(day_skipped))
+        idx = bisect_right(switch_times, now_time)
+        if idx < len(switch_times):
+            return switch_times[idx], themes[idx], list(skipped)
+        # All of the day's switches are past, look at the next day
+        day += timedelta(days=1)
+    sys.exit("[ERROR] None of the themes switch within the next year")
+
+
+def _skipped_note(skipped):
+    """
+    Suffix for the log record of a scheduling pass, naming the skipped themes.
+    """
+    if not skipped:
+        return ""
+    return f", the sun doesn't reach these phases until then: {', '.join(skipped)}"
+
+
+def on_switch_timeout(theme, theme_switch_time):
+    """
+    GLib timeout callback switching to theme, due at theme_switch_time, and
+    scheduling the next switch.
+    """
+    from gi.repository import GLib
+
+    global switch_source_id
+    # This source is done, don't let a wakeup remove it
+    switch_source_id = None
+    # Schedule first, so that a failing switch doesn't stop the following ones
+    switch_time, next_theme, skipped = schedule_theme_switch(
+        after=theme_switch_time
+    )
+    # One log record per switch
+    try:
+        switch_theme(theme)
+    except Exception:
+        logger.exception(
+            "Could not switch to %s, next switch to %s at: %s%s",
+            theme.name,
+            next_theme.name,
+            switch_time,
+            _skipped_note(skipped),
         )
-        delta_t = now_time - switch_time
-        seconds = delta_t.seconds + 1
-        if seconds > 0 and (seconds < diff or diff == -1):
-            diff = seconds
-            preferred_theme = theme
-
-    theme_file = theme_folder_path / f"{preferred_theme['name']}.toml"
-
-    if not theme_file.exists():
-        sys.exit(f"[ERROR] {preferred_theme['name']} is not installed in {theme_file}")
-    with open(theme_file, "r") as f:
-        theme_data = load_toml(f)
-    switch_theme(theme_data)
-
-
-def set_theme_switch_timers():
-    """
-    Set a suitable theme and start/restart thread timers
-    for theme switching. The main daemon loop.
-    """
-    set_appropriate_theme(datetime.now(timezone.utc))
-    # Hot loop
-    while True:
-        now_time = datetime.now(timezone.utc)
-        for theme in circadian["themes"]:
-            theme_file = theme["name"] + ".toml"
-            curr_theme_path = theme_folder_path / theme_file
-            if not curr_theme_path.exists():
-                sys.exit(
-                    f"[ERROR] Theme {theme['name']} not installed in {theme_folder_path}"
-                )
-            theme_time = get_theme_time(theme, now_time)
-            with open(curr_theme_path, "r") as f:
-                theme_data = load_toml(f)
-            if theme_time < now_time:
-                # Set Date to today
-                switch_time = now_time.replace(
-                    day=now_time.day,
-                    hour=theme_time.hour,
-                    minute=theme_time.minute,
-                    second=0,
-                    microsecond=0,
-                )
-                # Add one day without overflowing current month
-                switch_time = switch_time + timedelta(days=1)
-            else:
-                switch_time = now_time.replace(
-                    hour=theme_time.hour,
-                    minute=theme_time.minute,
-                    second=0,
-                    microsecond=0,
-                )
-            delta_t = switch_time - now_time
-            seconds = delta_t.seconds + 1
-            timer_thread = Timer(seconds, thread_switch_theme, [theme_data])
-            thread_list.append(timer_thread)
-            timer_thread.start()
-            # Flush stdout to output to log journal
-            local_timezone = datetime.now(timezone.utc).astimezone().tzinfo
-            print(
-                f"[LOG] Setting up timer- {timer_thread.ident} for {theme['name']}"
-                f" at: {switch_time.astimezone(local_timezone)}",
-                flush=True,
-            )
-        for thread in thread_list:
-            thread.join()
-        # All threads have finished, flush
-        thread_list.clear()
+    else:
+        logger.info(
+            "Switched to %s, next switch to %s at: %s%s",
+            theme.name,
+            next_theme.name,
+            switch_time,
+            _skipped_note(skipped),
+        )
+    return GLib.SOURCE_REMOVE
+
+
+def schedule_theme_switch(apply_current_theme=False, after=None):
+    """
+    Add a GLib timeout for the next theme switch after now (or after the
+    after datetime, if later), then set a suitable theme if
+    apply_current_theme. Returns the (switch_time, theme, skipped) of the next
+    switch, for the caller to log.
+    """
+    from gi.repository import GLib
+
+    global switch_source_id, LOCAL_TZ
+    # A single localtime lookup gives both the local date and timezone. Once
+    # per switch is enough to follow DST and timezone changes, including the
+    # ones made while the system was asleep
+    now_time = datetime.now().astimezone()
+    if now_time.tzinfo != LOCAL_TZ:
+        LOCAL_TZ = now_time.tzinfo
+        compute_switch_table.cache_clear()
+    # timeout_add_seconds() can fire a bit early, so a timeout passes its own
+    # switch time to not find that same switch again
+    if after is not None:
+        after = max(now_time, after.astimezone())
+    else:
+        after = now_time
+    switch_time, theme, skipped = next_switch_deadline(after)
+    # timeout_add_seconds() only has a granularity of seconds
+    seconds = max(0, ceil((switch_time - now_time).total_seconds()))
+    switch_source_id = GLib.timeout_add_seconds(
+        seconds, on_switch_timeout, theme, switch_time
+    )
+    # Set the theme once the next switch is scheduled, so it happens either way
+    if apply_current_theme:
+        try:
+            set_appropriate_theme(now_time)
+        except Exception:
+            logger.exception("Could not set the current theme")
+    return switch_time.astimezone(), theme, skipped
 
 
 def handle_wakeup_callback(going_to_sleep_flag):
+    from gi.repository import GLib
+
     if going_to_sleep_flag == 0:
-        print("[LOG] System has just woken up from hibernate/sleep, refreshing threads")
-        for thread in thread_list:
-            thread.cancel()
-        set_appropriate_theme(datetime.now(timezone.utc))
+        # The monotonic clock stops while sleeping, the pending timeout is stale
+        if switch_source_id is not None:
+            GLib.source_remove(switch_source_id)
+        switch_time, theme, skipped = schedule_theme_switch(apply_current_theme=True)
+        logger.info(
+            "System has just woken up from hibernate/sleep, next switch to %s at: %s%s",
+            theme.name,
+            switch_time,
+            _skipped_note(skipped),
+        )
 
 
 def enable_dbus_main_loop():
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+
     DBusGMainLoop(set_as_default=True)
     system_bus = dbus.SystemBus()
-    dbus.mainloop.glib.threads_init()
     system_bus.add_signal_receiver(
         handle_wakeup_callback,
         "PrepareForSleep",
@@ -270,11 +565,18 @@ def main():
     """
     Entry point
     """
-    print("[LOG] Starting dbus main loop")
-    dbus_thread = Thread(target=enable_dbus_main_loop)
-    dbus_thread.start()
-    # Set flag to true for first run
-    set_theme_switch_timers()
+    global app
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+    app = _bootstrap()
+    watch_theme_folder()
+    switch_time, theme, skipped = schedule_theme_switch(apply_current_theme=True)
+    logger.info(
+        "Starting dbus main loop, next switch to %s at: %s%s",
+        theme.name,
+        switch_time,
+        _skipped_note(skipped),
+    )
+    enable_dbus_main_loop()
 
 
 if __name__ == "__main__":
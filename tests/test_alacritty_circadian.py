@@ -0,0 +1,151 @@
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from alacritty_circadian import alacritty_circadian as ac
+
+LONDON = ac.Observer(51.5074, -0.1278)
+TROMSO = ac.Observer(69.6492, 18.9553)
+SVALBARD = ac.Observer(78.2232, 15.6267)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+# Reference times from astral 3.2, which sun() replaced
+LONDON_TIMES = {
+    date(2026, 6, 21): {
+        "dawn": utc(2026, 6, 21, 2, 54, 45),
+        "sunrise": utc(2026, 6, 21, 3, 43, 27),
+        "noon": utc(2026, 6, 21, 12, 2, 13),
+        "sunset": utc(2026, 6, 21, 20, 21, 12),
+        "dusk": utc(2026, 6, 21, 21, 9, 54),
+    },
+    date(2026, 12, 21): {
+        "dawn": utc(2026, 12, 21, 7, 22, 59),
+        "sunrise": utc(2026, 12, 21, 8, 4, 6),
+        "noon": utc(2026, 12, 21, 11, 58, 20),
+        "sunset": utc(2026, 12, 21, 15, 53, 3),
+        "dusk": utc(2026, 12, 21, 16, 34, 10),
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    yield
+    ac.compute_switch_table.cache_clear()
+    ac._sun_cached.cache_clear()
+
+
+@pytest.fixture
+def local_tz(monkeypatch):
+    def set_local_tz(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+
+    yield set_local_tz
+    monkeypatch.undo()
+    time.tzset()
+
+
+def use_themes(monkeypatch, observer, *themes):
+    """
+    Set up the app with themes given as (name, time) tuples, time being either
+    a sun phase or HH:MM.
+    """
+    compiled = []
+    for name, theme_time in themes:
+        if theme_time in ac.times_of_sun:
+            theme = ac.CompiledTheme(name, Path(name), solar_phase=theme_time)
+        else:
+            hour, minute = map(int, theme_time.split(":"))
+            theme = ac.CompiledTheme(name, Path(name), hour=hour, minute=minute)
+        compiled.append(theme)
+    app = SimpleNamespace(themes=compiled, observer=observer)
+    monkeypatch.setattr(ac, "app", app, raising=False)
+
+
+def local(*args):
+    return datetime(*args).astimezone()
+
+
+@pytest.mark.parametrize("day", LONDON_TIMES)
+def test_sun_mid_latitude(day):
+    times = ac.sun(LONDON, day)
+    for phase, expected in LONDON_TIMES[day].items():
+        assert abs(times[phase] - expected) < timedelta(minutes=1), phase
+
+
+def test_sun_polar_night():
+    times = ac.sun(TROMSO, date(2026, 12, 21))
+    assert times["sunrise"] is None and times["sunset"] is None
+    assert None not in (times["dawn"], times["noon"], times["dusk"])
+    times = ac.sun(SVALBARD, date(2026, 12, 21))
+    assert [phase for phase, t in times.items() if t is not None] == ["noon"]
+
+
+def test_sun_midnight_sun():
+    times = ac.sun(TROMSO, date(2026, 6, 21))
+    assert [phase for phase, t in times.items() if t is not None] == ["noon"]
+
+
+def test_next_switch_across_midnight(monkeypatch, local_tz):
+    local_tz("UTC")
+    use_themes(monkeypatch, LONDON, ("light", "07:00"), ("dark", "22:00"))
+    switch_time, theme, skipped = ac.next_switch_deadline(local(2026, 5, 4, 23, 30))
+    assert (switch_time, theme.name, skipped) == (local(2026, 5, 5, 7), "light", [])
+
+
+def test_next_switch_is_strictly_after(monkeypatch, local_tz):
+    local_tz("UTC")
+    use_themes(monkeypatch, LONDON, ("light", "07:00"), ("dark", "22:00"))
+    switch_time, theme, _ = ac.next_switch_deadline(local(2026, 5, 4, 22))
+    assert (switch_time, theme.name) == (local(2026, 5, 5, 7), "light")
+
+
+@pytest.mark.parametrize(
+    "now, offset",
+    [
+        # The night before DST ends, and before it starts
+        ((2026, 10, 24, 23), timedelta(hours=1)),
+        ((2026, 3, 28, 23), timedelta(hours=2)),
+    ],
+)
+def test_next_switch_across_dst(monkeypatch, local_tz, now, offset):
+    local_tz("Europe/Rome")
+    use_themes(monkeypatch, LONDON, ("light", "07:00"), ("dark", "22:00"))
+    switch_time, theme, _ = ac.next_switch_deadline(local(*now))
+    assert theme.name == "light"
+    assert switch_time.astimezone().hour == 7
+    assert switch_time.utcoffset() == offset
+
+
+def test_duplicate_switch_times_agree(monkeypatch, local_tz):
+    local_tz("UTC")
+    use_themes(
+        monkeypatch,
+        LONDON,
+        ("first", "07:00"),
+        ("second", "07:00"),
+        ("dark", "22:00"),
+    )
+    switch_time, theme, _ = ac.next_switch_deadline(local(2026, 5, 4, 6))
+    assert theme.name == "second"
+    switched = []
+    monkeypatch.setattr(ac, "switch_theme", lambda t: switched.append(t.name))
+    ac.set_appropriate_theme(switch_time)
+    assert switched == ["second"]
+
+
+def test_next_switch_over_polar_night(monkeypatch, local_tz):
+    local_tz("Europe/Oslo")
+    use_themes(monkeypatch, TROMSO, ("light", "sunrise"), ("dark", "sunset"))
+    switch_time, theme, skipped = ac.next_switch_deadline(local(2026, 12, 20, 12))
+    assert theme.name == "light"
+    assert switch_time.date() == date(2027, 1, 15)
+    assert skipped == ["light (sunrise)", "dark (sunset)"]